@@ -0,0 +1,126 @@
+# Copyright 2020 Jamie Thompson.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Single entrypoint for analysing the short and long experiments. Each subcommand only imports
+what it needs, so numeric only output never loads matplotlib or pandas
+"""
+import argparse
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+SHORT_DIR = os.path.join(ROOT, "short")
+LONG_DIR = os.path.join(ROOT, "long")
+
+LONG_SUMMARY_FILE = "results/summary.md"
+
+def use_experiment(experiment_dir, results_dir):
+    """
+    Makes the experiment's modules importable, and runs from within the directory holding its
+    results so that the relative results paths resolve
+    """
+    sys.path.insert(0, experiment_dir)
+    os.chdir(results_dir)
+
+def short(args, rest):
+    use_experiment(SHORT_DIR, args.dir)
+    import analyse
+
+    results = analyse.load_results()
+    if args.output == "json":
+        json.dump(analyse.build_table(*results), sys.stdout)
+        print()
+        return
+    analyse.create_table(*results)
+    if args.output == "all":
+        horizontal_replicas, predictive_replicas, horizontal_latencies, predictive_latencies = results
+        analyse.plot_replica_comparison(horizontal_replicas, predictive_replicas)
+        analyse.plot_avg_latency_comparison(horizontal_latencies, predictive_latencies)
+        analyse.plot_max_latency_comparison(horizontal_latencies, predictive_latencies)
+        analyse.plot_failed_to_success_request_percentage(horizontal_latencies, predictive_latencies)
+
+def long(args, rest):
+    use_experiment(LONG_DIR, args.dir)
+    import follow
+
+    autoscalers = follow.load_autoscalers()
+    for autoscaler in autoscalers.values():
+        autoscaler.update()
+    if args.output == "json":
+        json.dump(follow.summary_rows(autoscalers), sys.stdout)
+        print()
+        return
+    follow.create_summary(autoscalers, output=LONG_SUMMARY_FILE)
+    if args.output == "all":
+        import analyse
+        analyse.main()
+
+def significance(args, rest):
+    sys.path.insert(0, ROOT)
+    import significance as significance_module
+
+    parser = argparse.ArgumentParser(prog="analysis.py significance")
+    significance_module.add_arguments(parser)
+    significance_module.run(parser.parse_args(rest))
+
+def follow(args, rest):
+    use_experiment(LONG_DIR, args.dir)
+    import follow as follow_module
+
+    parser = argparse.ArgumentParser(prog="analysis.py follow")
+    follow_module.add_arguments(parser)
+    follow_module.run(parser.parse_args(rest))
+
+def main():
+    # Never try to open a window, even if a graph is drawn
+    os.environ["MPLBACKEND"] = "Agg"
+
+    parser = argparse.ArgumentParser(description="Analyse the results of the PHPA vs HPA experiments")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    short_parser = subparsers.add_parser("short", help="analyse the short experiment")
+    short_parser.add_argument("--dir", default=SHORT_DIR,
+        help="directory containing results/results.json, defaults to the short experiment")
+    short_parser.add_argument("--output", choices=["all", "table", "json"], default="all",
+        help="all graphs and the markdown table, only the markdown table, or the table as JSON to stdout")
+    short_parser.set_defaults(func=short)
+
+    long_parser = subparsers.add_parser("long", help="analyse the long experiment")
+    long_parser.add_argument("--dir", default=LONG_DIR,
+        help="directory containing results/hpa/ and results/phpa/, defaults to the long experiment")
+    long_parser.add_argument("--output", choices=["all", "table", "json"], default="all",
+        help="all graphs and the per day markdown summary, only the summary, or the summary as JSON to stdout")
+    long_parser.set_defaults(func=long)
+
+    # The follow and significance arguments are defined by their own modules, these are only
+    # imported, and their arguments parsed, once the subcommand is known
+    follow_parser = subparsers.add_parser("follow", add_help=False,
+        help="follow the results of a running long experiment, see long/follow.py --help")
+    follow_parser.add_argument("--dir", default=LONG_DIR,
+        help="directory containing results/hpa/ and results/phpa/, defaults to the long experiment")
+    follow_parser.set_defaults(func=follow)
+
+    significance_parser = subparsers.add_parser("significance", add_help=False,
+        help="compare repeated runs with bootstrap confidence intervals, see significance.py --help")
+    significance_parser.set_defaults(func=significance)
+
+    args, rest = parser.parse_known_args()
+    if rest and args.command not in ("follow", "significance"):
+        parser.error(f"unrecognized arguments: {' '.join(rest)}")
+    args.func(args, rest)
+
+if __name__ == "__main__":
+    main()
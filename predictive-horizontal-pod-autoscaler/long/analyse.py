@@ -15,11 +15,22 @@
 import csv
 import numpy as np
 import pandas as pd
+import matplotlib
+matplotlib.use("Agg")
 from matplotlib import pyplot as plt
 import matplotlib.dates as mdates
 from matplotlib.ticker import (MultipleLocator, FormatStrFormatter,
                                AutoMinorLocator)
 
+def day_limits(times, day, start=None):
+    """
+    Time axis limits for a day of the experiment, days are counted from start, which defaults
+    to the earliest of the times given
+    """
+    if start is None:
+        start = times.min()
+    return [start + pd.to_timedelta((day-1)*24*60*60, unit='s'), start + pd.to_timedelta(day*24*60*60, unit='s')]
+
 def plot_replica_comparison(svg_name, hpa_replicas, hpa_latency, phpa_replicas, phpa_latency):
     fig, axs = plt.subplots(2, 2,figsize=[15,15])
 
@@ -122,7 +133,7 @@ def plot_avg_latency_comparison(svg_name, hpa_latency, phpa_latency):
     fig.tight_layout()
     plt.savefig(f"results/{svg_name}.svg")
 
-def plot_avg_latency_comparison_day(svg_name, day, hpa_latency, hpa_replicas, phpa_latency, phpa_replicas):
+def plot_avg_latency_comparison_day(svg_name, day, hpa_latency, hpa_replicas, phpa_latency, phpa_replicas, start=None):
     fig, axs = plt.subplots(2, 2,figsize=[15,15])
     axs[0,0].plot(hpa_latency["time"], hpa_latency["avg_response_time"], color="green")
     axs[0,0].legend(["hpa average latency"], loc="upper left")
@@ -130,13 +141,13 @@ def plot_avg_latency_comparison_day(svg_name, day, hpa_latency, hpa_replicas, ph
     axs[0,0].set_ylabel("average latency")
     axs[0,0].set_title("average latency for hpa over time")
     axs[0,0].set_ylim([0,600])
-    axs[0,0].set_xlim([hpa_latency["time"].min() + pd.to_timedelta((day-1)*24*60*60, unit='s'), hpa_latency["time"].min() + pd.to_timedelta(day*24*60*60, unit='s')])
+    axs[0,0].set_xlim(day_limits(hpa_latency["time"], day, start))
 
     axs[1,0].set_ylabel("number of replicas")
     axs[1,0].plot(hpa_replicas["time"], hpa_replicas["replicas"], color="green")
     axs[1,0].legend(["hpa number of requests"], loc="upper right")
     axs[1,0].set_title("number of requests for hpa over time")
-    axs[1,0].set_xlim([hpa_replicas["time"].min() + pd.to_timedelta((day-1)*24*60*60, unit='s'), hpa_replicas["time"].min() + pd.to_timedelta(day*24*60*60, unit='s')])
+    axs[1,0].set_xlim(day_limits(hpa_replicas["time"], day, start))
 
     axs[0,1].plot(phpa_latency["time"], phpa_latency["avg_response_time"], color="purple")
     axs[0,1].legend(["phpa average latency"], loc="upper left")
@@ -144,13 +155,13 @@ def plot_avg_latency_comparison_day(svg_name, day, hpa_latency, hpa_replicas, ph
     axs[0,1].set_ylabel("average latency")
     axs[0,1].set_title("average latency for phpa over time")
     axs[0,1].set_ylim([0,600])
-    axs[0,1].set_xlim([phpa_latency["time"].min() + pd.to_timedelta((day-1)*24*60*60, unit='s'), phpa_latency["time"].min() + pd.to_timedelta(day*24*60*60, unit='s')])
+    axs[0,1].set_xlim(day_limits(phpa_latency["time"], day, start))
 
     axs[1,1].set_ylabel("number of replicas")
     axs[1,1].plot(phpa_replicas["time"], phpa_replicas["replicas"], color="purple")
     axs[1,1].legend(["phpa number of replicas"], loc="upper right")
     axs[1,1].set_title("number of replicas for phpa over time")
-    axs[1,1].set_xlim([hpa_replicas["time"].min() + pd.to_timedelta((day-1)*24*60*60, unit='s'), hpa_replicas["time"].min() + pd.to_timedelta(day*24*60*60, unit='s')])
+    axs[1,1].set_xlim(day_limits(hpa_replicas["time"], day, start))
 
     for i in range(2):
         for j in range(2):
@@ -164,7 +175,7 @@ def plot_avg_latency_comparison_day(svg_name, day, hpa_latency, hpa_replicas, ph
     fig.tight_layout()
     plt.savefig(f"results/{svg_name}.svg")
 
-def plot_max_latency_comparison_day(svg_name, day, hpa_latency, hpa_replicas, phpa_latency, phpa_replicas):
+def plot_max_latency_comparison_day(svg_name, day, hpa_latency, hpa_replicas, phpa_latency, phpa_replicas, start=None):
     fig, axs = plt.subplots(2, 2,figsize=[15,15])
     axs[0,0].plot(hpa_latency["time"], hpa_latency["max_response_time"], color="green")
     axs[0,0].legend(["hpa maximum latency"], loc="upper left")
@@ -172,13 +183,13 @@ def plot_max_latency_comparison_day(svg_name, day, hpa_latency, hpa_replicas, ph
     axs[0,0].set_ylabel("maximum latency")
     axs[0,0].set_title("maximum latency for hpa over time")
     axs[0,0].set_ylim([0,6000])
-    axs[0,0].set_xlim([hpa_latency["time"].min() + pd.to_timedelta((day-1)*24*60*60, unit='s'), hpa_latency["time"].min() + pd.to_timedelta(day*24*60*60, unit='s')])
+    axs[0,0].set_xlim(day_limits(hpa_latency["time"], day, start))
 
     axs[1,0].set_ylabel("number of replicas")
     axs[1,0].plot(hpa_replicas["time"], hpa_replicas["replicas"], color="green")
     axs[1,0].legend(["hpa number of replicas"], loc="upper right")
     axs[1,0].set_title("number of replicas for hpa over time")
-    axs[1,0].set_xlim([hpa_replicas["time"].min() + pd.to_timedelta((day-1)*24*60*60, unit='s'), hpa_replicas["time"].min() + pd.to_timedelta(day*24*60*60, unit='s')])
+    axs[1,0].set_xlim(day_limits(hpa_replicas["time"], day, start))
 
     axs[0,1].plot(phpa_latency["time"], phpa_latency["max_response_time"], color="purple")
     axs[0,1].legend(["phpa maximum latency"], loc="upper left")
@@ -186,13 +197,13 @@ def plot_max_latency_comparison_day(svg_name, day, hpa_latency, hpa_replicas, ph
     axs[0,1].set_ylabel("maximum latency")
     axs[0,1].set_title("maximum latency for phpa over time")
     axs[0,1].set_ylim([0,6000])
-    axs[0,1].set_xlim([phpa_latency["time"].min() + pd.to_timedelta((day-1)*24*60*60, unit='s'), phpa_latency["time"].min() + pd.to_timedelta(day*24*60*60, unit='s')])
+    axs[0,1].set_xlim(day_limits(phpa_latency["time"], day, start))
 
     axs[1,1].set_ylabel("number of replicas")
     axs[1,1].plot(phpa_replicas["time"], phpa_replicas["replicas"], color="purple")
     axs[1,1].legend(["phpa number of replicas"], loc="upper right")
     axs[1,1].set_title("number of replicas for phpa over time")
-    axs[1,1].set_xlim([phpa_replicas["time"].min() + pd.to_timedelta((day-1)*24*60*60, unit='s'), phpa_replicas["time"].min() + pd.to_timedelta(day*24*60*60, unit='s')])
+    axs[1,1].set_xlim(day_limits(phpa_replicas["time"], day, start))
 
     for i in range(2):
         for j in range(2):
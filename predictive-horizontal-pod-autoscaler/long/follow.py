@@ -0,0 +1,274 @@
+# Copyright 2020 Jamie Thompson.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Follows the results of a running long experiment, updating per day statistics and graphs as
+new results are written
+"""
+import argparse
+import os
+import time
+
+POLL_INTERVAL = 60
+DAY_SECONDS = 24*60*60
+
+SUMMARY_FILE = "results/live_summary.md"
+
+def optional_float(value):
+    """
+    Parses a float that may have been written as None, such as the latencies of a load test run
+    that made no requests
+    """
+    if value == "None":
+        return None
+    return float(value)
+
+class Tail:
+    """
+    Reads the rows appended to a CSV file since it was last read, partially written rows are
+    left until they are complete
+    """
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self.partial = b""
+
+    def shrunk(self):
+        """
+        Whether the file is now smaller than has been read, as when it is truncated and rewritten
+        by copying the results again
+        """
+        try:
+            return os.path.getsize(self.path) < self.offset
+        except FileNotFoundError:
+            return self.offset > 0
+
+    def read_rows(self):
+        try:
+            with open(self.path, "rb") as file:
+                file.seek(self.offset)
+                data = file.read()
+        except FileNotFoundError:
+            return []
+        self.offset += len(data)
+        lines = (self.partial + data).split(b"\n")
+        self.partial = lines.pop()
+        return [line.decode().split(",") for line in lines if line]
+
+class DayStats:
+    """
+    Running aggregates for a single day of a single autoscaler
+    """
+    def __init__(self):
+        self.num_runs = 0
+        self.num_requests = 0
+        self.num_requests_fail = 0
+        self.latency_requests = 0
+        self.weighted_latency = 0.0
+        self.min_avg_latency = float("inf")
+        self.max_avg_latency = 0.0
+        self.max_latency = 0.0
+        self.replica_seconds = 0.0
+        self.replica_samples = 0
+        self.replica_total = 0
+
+    def add_load(self, num_requests, num_requests_fail, avg_response_time, max_response_time):
+        self.num_runs += 1
+        self.num_requests += num_requests
+        self.num_requests_fail += num_requests_fail
+        # Runs without any latencies still count towards the requests, but not the latencies
+        if avg_response_time is not None:
+            self.latency_requests += num_requests
+            self.weighted_latency += avg_response_time * num_requests
+            self.min_avg_latency = min(self.min_avg_latency, avg_response_time)
+            self.max_avg_latency = max(self.max_avg_latency, avg_response_time)
+        if max_response_time is not None:
+            self.max_latency = max(self.max_latency, max_response_time)
+
+    def add_replicas(self, replicas, seconds):
+        self.replica_samples += 1
+        self.replica_total += replicas
+        self.replica_seconds += seconds
+
+    def summary(self):
+        return {
+            "num requests": self.num_requests,
+            "fail requests (%)": self.num_requests_fail / self.num_requests * 100 if self.num_requests else None,
+            "avg latency": self.weighted_latency / self.latency_requests if self.latency_requests else None,
+            "min avg latency": self.min_avg_latency if self.latency_requests else None,
+            "max avg latency": self.max_avg_latency if self.latency_requests else None,
+            "max latency": self.max_latency if self.latency_requests else None,
+            "avg replicas": self.replica_total / self.replica_samples if self.replica_samples else None,
+            "replica seconds": self.replica_seconds
+        }
+
+class Autoscaler:
+    """
+    Incrementally follows the load and replica results of a single autoscaler; all work done per
+    update is proportional to the number of new rows
+    """
+    def __init__(self, path):
+        self.path = path
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets all results read so far, so they are read again from the beginning of the files
+        """
+        self.load_tail = Tail(os.path.join(self.path, "load.csv"))
+        self.replicas_tail = Tail(os.path.join(self.path, "replicas.csv"))
+        self.start = None
+        self.skipped_first_load = False
+        self.last_replicas = None
+        self.days = {}
+        self.latency_rows = {}
+        self.replica_rows = {}
+
+    def _day(self, timestamp):
+        return int((timestamp - self.start) // DAY_SECONDS) + 1
+
+    def update(self):
+        """
+        Reads any new results, returning the set of days that changed
+        """
+        changed = set()
+        if self.load_tail.shrunk() or self.replicas_tail.shrunk():
+            # The results have been replaced, e.g. copied again, so rows already counted will be
+            # read again; start over and redraw every day that was known
+            print("Results in", self.path, "were replaced, reading them again")
+            changed |= set(self.days)
+            self.reset()
+        for row in self.replicas_tail.read_rows():
+            try:
+                timestamp, replicas = float(row[0]), int(row[1])
+            except (ValueError, IndexError):
+                print("Skipping malformed replicas row:", ",".join(row))
+                continue
+            # As in analyse.py, the first replica count marks the start and is then dropped
+            if self.start is None:
+                self.start = timestamp
+                continue
+            day = self._day(timestamp)
+            seconds = 0
+            if self.last_replicas is not None:
+                seconds = self.last_replicas[1] * (timestamp - self.last_replicas[0])
+            self.days.setdefault(day, DayStats()).add_replicas(replicas, seconds)
+            self.replica_rows.setdefault(day, []).append((timestamp - self.start, replicas))
+            self.last_replicas = (timestamp, replicas)
+            changed.add(day)
+
+        # Load results are relative to the first replica count, so wait until it is known
+        if self.start is None:
+            return changed
+
+        for row in self.load_tail.read_rows():
+            if not self.skipped_first_load:
+                self.skipped_first_load = True
+                continue
+            try:
+                timestamp = float(row[0])
+                num_requests, num_requests_fail = int(row[1]), int(row[2])
+                avg_response_time, min_response_time, max_response_time = (optional_float(value) for value in row[3:6])
+            except (ValueError, IndexError):
+                print("Skipping malformed load row:", ",".join(row))
+                continue
+            day = self._day(timestamp)
+            self.days.setdefault(day, DayStats()).add_load(num_requests, num_requests_fail, avg_response_time, max_response_time)
+            self.latency_rows.setdefault(day, []).append(
+                (timestamp - self.start, num_requests, num_requests_fail, avg_response_time, min_response_time, max_response_time))
+            changed.add(day)
+        return changed
+
+    def latency_frame(self, day):
+        import pandas as pd
+
+        latency = pd.DataFrame(self.latency_rows.get(day, []),
+            columns=["time", "num_requests", "num_requests_fail","avg_response_time","min_response_time","max_response_time"])
+        latency["time"] = pd.to_datetime(latency["time"], unit="s")
+        # Unknown latencies become NaN, matching how pandas reads them in analyse.py
+        latency_columns = ["avg_response_time", "min_response_time", "max_response_time"]
+        latency[latency_columns] = latency[latency_columns].astype(float)
+        return latency
+
+    def replicas_frame(self, day):
+        import pandas as pd
+
+        replicas = pd.DataFrame(self.replica_rows.get(day, []), columns=["time", "replicas"])
+        replicas["time"] = pd.to_datetime(replicas["time"], unit="s")
+        return replicas
+
+def plot_day(day, hpa, phpa):
+    # Graphing is only needed when days change, importing it lazily keeps summary only
+    # analysis free of pandas and matplotlib
+    import pandas as pd
+    from analyse import plot_avg_latency_comparison_day, plot_max_latency_comparison_day
+    from matplotlib import pyplot as plt
+
+    start = pd.Timestamp(0)
+    hpa_latency, hpa_replicas = hpa.latency_frame(day), hpa.replicas_frame(day)
+    phpa_latency, phpa_replicas = phpa.latency_frame(day), phpa.replicas_frame(day)
+    # Prefixed so the live graphs, with days counted from the first replica count, never
+    # overwrite those drawn by analyse.py
+    plot_avg_latency_comparison_day(f"live_avg_latency_day_{day}", day, hpa_latency, hpa_replicas, phpa_latency, phpa_replicas, start)
+    plot_max_latency_comparison_day(f"live_max_latency_day_{day}", day, hpa_latency, hpa_replicas, phpa_latency, phpa_replicas, start)
+    plt.close("all")
+
+def summary_rows(autoscalers):
+    rows = []
+    for name, autoscaler in autoscalers.items():
+        for day in sorted(autoscaler.days):
+            rows.append({"autoscaler": name, "day": day, **autoscaler.days[day].summary()})
+    return rows
+
+def create_summary(autoscalers, output=SUMMARY_FILE):
+    from tabulate import tabulate
+
+    with open(output, "w") as table_file:
+        table_file.write(tabulate(summary_rows(autoscalers), tablefmt="pipe", headers="keys"))
+
+def load_autoscalers():
+    return {
+        "hpa": Autoscaler("results/hpa"),
+        "phpa": Autoscaler("results/phpa")
+    }
+
+def follow(interval=POLL_INTERVAL):
+    autoscalers = load_autoscalers()
+    while True:
+        changed = set()
+        for autoscaler in autoscalers.values():
+            changed |= autoscaler.update()
+        if changed:
+            print("Updating days:", ", ".join(str(day) for day in sorted(changed)))
+            create_summary(autoscalers)
+            for day in sorted(changed):
+                plot_day(day, autoscalers["hpa"], autoscalers["phpa"])
+        time.sleep(interval)
+
+def add_arguments(parser):
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL,
+        help="seconds between checking for new results")
+
+def run(args):
+    try:
+        follow(args.interval)
+    except KeyboardInterrupt:
+        print("Stopping...")
+
+def main():
+    parser = argparse.ArgumentParser(description="Follow the results of a running long experiment")
+    add_arguments(parser)
+    run(parser.parse_args())
+
+if __name__ == "__main__":
+    main()
@@ -13,25 +13,33 @@
 # limitations under the License.
 
 import json
+import os
 import signal
 import time
 import invokust
 import asyncio
+import math
 from datetime import datetime
 from threading import Thread
 from kubernetes import client, config
+from kubernetes.client.rest import ApiException
+from traffic import Profile
 
 LABEL_SELECTOR = "run=experiment-deployment"
 NAMESPACE = "default"
+DEPLOYMENT_NAME = "experiment-deployment"
 
 REPLICAS_FILE = "/results/replicas.csv"
 LOAD_RESULTS_FILE = "/results/load.csv"
+READINESS_FILE = "/results/readiness.csv"
+PODS_FILE = "/results/pods.csv"
+POD_STARTUP_FILE = "/results/pod_startup.csv"
 
 HOST = "http://experiment-deployment.default.svc.cluster.local"
 LOCUST_FILE = "/locust/locust.py"
 
 RUN_TIME = "5m"
-MONITOR_INTERVAL = 15
+MONITOR_INTERVAL = float(os.environ.get("MONITOR_INTERVAL", 15))
 
 LOW_NUM_CLIENTS = 15
 LOW_HATCH_RATE = 3
@@ -45,6 +53,17 @@ HIGH_HATCH_RATE = 20
 MEDIUM_LOAD = (9, 12)
 HIGH_LOAD = (15, 17)
 
+# Replaying a load profile built with traffic.py replaces the fixed low/medium/high loads above
+LOAD_PROFILE = os.environ.get("LOAD_PROFILE")
+LOAD_PROFILE_SCALE = float(os.environ.get("LOAD_PROFILE_SCALE", 1))
+# The experiment deployment only serves /, so replayed requests are all sent to / unless the
+# target serves the recorded endpoints and sending them is enabled
+LOAD_PROFILE_PATHS = os.environ.get("LOAD_PROFILE_PATHS", "false").lower() == "true"
+# Each simulated user waits between 3 and 5 seconds between requests, see locust.py
+USER_WAIT_TIME = 4
+# Environment variable the endpoint mix is passed to the locust file through
+LOAD_MIX_ENV = "LOAD_MIX"
+
 class TimeRange:
     def __init__(self, start, end):
         self.start = start
@@ -61,8 +80,26 @@ class GracefulKiller:
         self.kill_now = True
 
 
+def aggregate_requests(requests):
+    """
+    Combines the per endpoint locust results into overall average, minimum and maximum response
+    times, weighting the average by the number of requests to each endpoint
+    """
+    requests = [request for request in requests.values() if request.get("num_requests")]
+    if not requests:
+        return None, None, None
+    num_requests = sum(request.get("num_requests") for request in requests)
+    avg_response_time = sum(request.get("avg_response_time") * request.get("num_requests") for request in requests) / num_requests
+    min_response_time = min(request.get("min_response_time") for request in requests)
+    max_response_time = max(request.get("max_response_time") for request in requests)
+    return avg_response_time, min_response_time, max_response_time
+
 def load():
     killer = GracefulKiller()
+    profile = None
+    if LOAD_PROFILE is not None:
+        print(f"Replaying load profile {LOAD_PROFILE}")
+        profile = Profile(LOAD_PROFILE)
     while not killer.kill_now:
         print("Running load")
         now = datetime.utcnow()
@@ -70,8 +107,21 @@ def load():
 
         num_clients = LOW_NUM_CLIENTS
         hatch_rate = LOW_HATCH_RATE
+        run_time = RUN_TIME
 
-        if MEDIUM_LOAD[0] <= now.hour < MEDIUM_LOAD[1]:
+        if profile is not None:
+            rate, mix, run_seconds = profile.at(now.timestamp())
+            # Each user makes a request roughly every USER_WAIT_TIME seconds
+            num_clients = max(1, round(rate * LOAD_PROFILE_SCALE * USER_WAIT_TIME))
+            hatch_rate = max(1, math.ceil(num_clients / 5))
+            # Runs last until the end of the profile step, so the rate follows the profile
+            run_time = f"{run_seconds}s"
+            total = sum(mix.values())
+            top = ", ".join(f"{endpoint} {count / total:.0%}" for endpoint, count in sorted(mix.items(), key=lambda item: -item[1])[:3])
+            print(f"Replaying {rate:.2f} requests per second for {run_time}, running {num_clients} clients; endpoint mix: {top}")
+            if LOAD_PROFILE_PATHS:
+                os.environ[LOAD_MIX_ENV] = json.dumps(mix)
+        elif MEDIUM_LOAD[0] <= now.hour < MEDIUM_LOAD[1]:
             print(f"Hour between {MEDIUM_LOAD[0]} and {MEDIUM_LOAD[1]}, running medium load")
             num_clients = MEDIUM_NUM_CLIENTS
             hatch_rate = MEDIUM_HATCH_RATE
@@ -87,18 +137,14 @@ def load():
             host=HOST,
             num_clients=num_clients,
             hatch_rate=hatch_rate,
-            run_time=RUN_TIME
+            run_time=run_time
         )
 
         load_test = invokust.LocustLoadTest(settings)
         load_test.run()
         results = load_test.stats()
 
-        requests = results.get("requests")
-        request = requests.get("GET_/")
-        avg_response_time = request.get("avg_response_time")
-        min_response_time = request.get("min_response_time")
-        max_response_time = request.get("max_response_time")
+        avg_response_time, min_response_time, max_response_time = aggregate_requests(results.get("requests"))
 
         num_requests = results.get("num_requests")
         num_requests_fail = results.get("num_requests_fail")
@@ -109,8 +155,89 @@ def load():
             file.write(f"{timestamp},{num_requests},{num_requests_fail},{avg_response_time},{min_response_time},{max_response_time}\n")
     print("Shutting down...")
 
+def parse_cpu(quantity):
+    """
+    Converts a K8s CPU quantity (e.g. 250m, 1, 1234567n) into millicores
+    """
+    if quantity is None:
+        return None
+    suffixes = {"n": 1e-6, "u": 1e-3, "m": 1}
+    if quantity[-1] in suffixes:
+        return float(quantity[:-1]) * suffixes[quantity[-1]]
+    return float(quantity) * 1000
+
+def pod_ready_time(pod):
+    """
+    Returns the time the pod last became Ready, or None if it is not Ready
+    """
+    for condition in pod.status.conditions or []:
+        if condition.type == "Ready" and condition.status == "True":
+            return condition.last_transition_time
+    return None
+
+def sample_pods(timestamp, client_core, client_custom, awaiting_ready):
+    """
+    Samples CPU usage and readiness for every pod of the deployment in a single batch.
+    awaiting_ready maps each pod seen so far to whether it is still waiting to become Ready for
+    the first time; start up times are only recorded for pods first seen not Ready, as the Ready
+    condition only holds the latest transition, which for a pod that was already Ready may be a
+    recovery rather than its start up
+    """
+    pods_resp = client_core.list_namespaced_pod(NAMESPACE, label_selector=LABEL_SELECTOR)
+
+    # The metrics server may not have any metrics yet, for example while it is starting up
+    # or for pods that have only just started, so missing CPU usage is left blank
+    cpu_usage = {}
+    try:
+        metrics_resp = client_custom.list_namespaced_custom_object(
+            "metrics.k8s.io", "v1beta1", NAMESPACE, "pods", label_selector=LABEL_SELECTOR)
+        for item in metrics_resp.get("items", []):
+            cpu_usage[item["metadata"]["name"]] = sum(
+                parse_cpu(container["usage"]["cpu"]) for container in item["containers"])
+    except ApiException as err:
+        print("Failed to get pod metrics:", err.reason)
+
+    pod_rows = []
+    startup_rows = []
+    pod_names = set()
+    for pod in pods_resp.items:
+        name = pod.metadata.name
+        pod_names.add(name)
+        # Pod names all share the deployment prefix, drop it to keep the time series compact
+        short_name = name[len(DEPLOYMENT_NAME) + 1:] if name.startswith(f"{DEPLOYMENT_NAME}-") else name
+
+        ready_time = pod_ready_time(pod)
+        cpu = cpu_usage.get(name)
+        cpu_request = sum(parse_cpu((container.resources.requests or {}).get("cpu")) or 0
+            for container in pod.spec.containers)
+        utilization = ""
+        if cpu is not None and cpu_request > 0:
+            utilization = f"{cpu / cpu_request * 100:.1f}"
+        cpu = "" if cpu is None else f"{cpu:.1f}"
+        pod_rows.append(f"{timestamp},{short_name},{int(ready_time is not None)},{cpu},{utilization}\n")
+
+        if name not in awaiting_ready:
+            awaiting_ready[name] = ready_time is None
+        elif ready_time is not None and awaiting_ready[name]:
+            awaiting_ready[name] = False
+            created = pod.metadata.creation_timestamp.timestamp()
+            ready = ready_time.timestamp()
+            startup_rows.append(f"{short_name},{created},{ready},{ready - created}\n")
+
+    # Forget pods that no longer exist to keep memory use bounded over a long experiment
+    for name in list(awaiting_ready):
+        if name not in pod_names:
+            del awaiting_ready[name]
+
+    with open(PODS_FILE, "a") as file:
+        file.writelines(pod_rows)
+    if startup_rows:
+        with open(POD_STARTUP_FILE, "a") as file:
+            file.writelines(startup_rows)
+
 def monitor():
     killer = GracefulKiller()
+    awaiting_ready = {}
     while not killer.kill_now:
         now = datetime.utcnow()
         timestamp = now.timestamp()
@@ -122,9 +249,19 @@ def monitor():
             pretty=True,
             label_selector=LABEL_SELECTOR)
 
-        replica_count = deployment_resp.items[0].status.replicas
+        status = deployment_resp.items[0].status
+        replica_count = status.replicas
         with open(REPLICAS_FILE, "a") as file:
             file.write(f"{timestamp},{replica_count}\n")
+        with open(READINESS_FILE, "a") as file:
+            file.write(f"{timestamp},{replica_count},{status.ready_replicas or 0},{status.available_replicas or 0}\n")
+
+        # Pod sampling is secondary to the replica counts, so a failure (e.g. a transient API
+        # error, or missing RBAC permissions for pods) is logged rather than stopping the monitor
+        try:
+            sample_pods(timestamp, client.CoreV1Api(), client.CustomObjectsApi(), awaiting_ready)
+        except Exception as err: # pylint: disable=W0703
+            print("Failed to sample pods:", str(err))
         time.sleep(MONITOR_INTERVAL)
 
 if __name__ == "__main__":
@@ -12,16 +12,42 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
 import os
+import random
 import urllib3
 from locust import HttpLocust, TaskSet, task, between
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# Set by load.py when replaying a load profile with LOAD_PROFILE_PATHS enabled, a JSON object
+# of endpoint to request count
+LOAD_MIX_ENV = "LOAD_MIX"
+# Requests not attributed to a recorded endpoint, these are sent to /, see load/traffic.py
+OTHER_ENDPOINT = "(other)"
+
+_mix = (None, ["/"], [1])
+
+def endpoint_mix():
+    """
+    Returns the endpoints and their weights, parsed only when the mix changes
+    """
+    global _mix
+    raw = os.environ.get(LOAD_MIX_ENV)
+    if raw != _mix[0]:
+        mix = json.loads(raw) if raw else {}
+        _mix = (raw, list(mix) or ["/"], list(mix.values()) or [1])
+    return _mix[1], _mix[2]
+
 class UserBehavior(TaskSet):
     @task(1)
     def profile(self):
-        self.client.get("/", verify=False)
+        endpoints, weights = endpoint_mix()
+        endpoint = random.choices(endpoints, weights)[0]
+        # Profiles replace ID-like path segments with {id}, fill them in and group the results
+        # by endpoint rather than by every distinct ID
+        path = "/" if endpoint == OTHER_ENDPOINT else endpoint.replace("{id}", str(random.randint(1, 1000)))
+        self.client.get(path, verify=False, name=endpoint)
 
 class WebsiteUser(HttpLocust):
     task_set = UserBehavior
@@ -0,0 +1,515 @@
+# Copyright 2020 Jamie Thompson.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Ingests production traffic, either access logs or request rate exports, into a compact load
+profile that the load generator can replay.
+
+Ingestion is a pipeline of generators, reading a line at a time and only ever holding a
+single window of per second counts in memory, so multi GB (optionally gzipped) inputs can be
+ingested in bounded memory. Each input is parsed separately and the requests merged in time
+order, so inputs may be given in any order and may overlap.
+
+Supported input lines:
+- Common/combined log format access logs, e.g.
+  127.0.0.1 - - [10/Oct/2020:13:55:36 +0000] "GET /items/42?a=b HTTP/1.1" 200 2326
+- Request rate exports as CSV, timestamp,count[,endpoint], with the timestamp either in
+  seconds (or milli, micro or nanoseconds) since the epoch or ISO 8601, e.g.
+  1602338136,25,/items
+"""
+import argparse
+import gzip
+import heapq
+import itertools
+import math
+import os
+import struct
+import sys
+import time
+import zlib
+from datetime import datetime, timezone
+
+MAGIC = b"PHPATRC1"
+HEADER = struct.Struct("<qI")
+
+# Endpoint mixes are recorded per window, matching the length of each load test run
+MIX_INTERVAL = 300
+# Only the most requested endpoints are recorded, all other requests (and those from request
+# rate exports without an endpoint) are recorded as OTHER_ENDPOINT, which is not a real path
+MAX_ENDPOINTS = 64
+OTHER_ENDPOINT = "(other)"
+# Candidate endpoints tracked while ingesting, per endpoint finally recorded
+CANDIDATES_PER_ENDPOINT = 4
+# Profiles are replayed in steps of this many seconds, each at the average rate of its step
+REPLAY_STEP = 60
+
+# Requests outside of these times are treated as unparseable, as are any more than MAX_GAP
+# seconds after the previous request, as every window in between would be written
+MIN_TIMESTAMP = 946684800 # 2000-01-01
+MAX_FUTURE = 24*60*60
+MAX_GAP = 7*24*60*60
+# Epoch timestamps this large are taken to be in milli, micro or nanoseconds
+MAX_EPOCH_SECONDS = 10**11
+
+READ_BUFFER = 1024 * 1024
+# Raw request paths are cached against their normalised endpoint, the cache is cleared when it
+# reaches this size to keep memory bounded with high cardinality paths
+ENDPOINT_CACHE_SIZE = 100000
+
+class Window:
+    """
+    Per second request counts and the endpoint mix for a window of a profile
+    """
+    def __init__(self, start, counts, mix):
+        self.start = start
+        self.counts = counts
+        self.mix = mix
+
+    def rate(self):
+        """
+        Average requests per second over the window
+        """
+        return sum(self.counts) / len(self.counts) if self.counts else 0
+
+def read_lines(paths):
+    """
+    Yields each line from each file in turn, gzipped files are decompressed as they are read
+    """
+    for path in paths:
+        if path == "-":
+            yield from sys.stdin.buffer
+            continue
+        with open(path, "rb") as file:
+            gzipped = file.read(2) == b"\x1f\x8b"
+        opener = gzip.open if gzipped else open
+        with opener(path, "rb") as file:
+            yield from _buffered(file)
+
+def _buffered(file):
+    # Larger reads than the default line iteration, cutting per read overhead on large files
+    partial = b""
+    while True:
+        data = file.read(READ_BUFFER)
+        if not data:
+            break
+        lines = (partial + data).split(b"\n")
+        partial = lines.pop()
+        yield from lines
+    if partial:
+        yield partial
+
+def normalise_endpoint(path):
+    """
+    Strips query strings and replaces ID-like path segments with {id}, so that endpoints map to
+    a bounded set of templates
+    """
+    path = path.split("?", 1)[0].split("#", 1)[0] or "/"
+    segments = path.split("/")
+    for i, segment in enumerate(segments):
+        if segment and (segment.isdigit() or (len(segment) >= 16 and all(c in "0123456789abcdefABCDEF-" for c in segment))):
+            segments[i] = "{id}"
+    return "/".join(segments)
+
+def _clf_timestamp(clf_time, days):
+    """
+    Converts a log timestamp, e.g. 10/Oct/2020:13:55:36 +0000, to seconds since the epoch. Only
+    the date is parsed with datetime, cached in days, as it is far slower than the arithmetic
+    """
+    date = clf_time[:11]
+    midnight = days.get(date)
+    if midnight is None:
+        midnight = int(datetime.strptime(date.decode(), "%d/%b/%Y").replace(tzinfo=timezone.utc).timestamp())
+        days[date] = midnight
+    offset = int(clf_time[22:24]) * 3600 + int(clf_time[24:26]) * 60
+    if clf_time[21:22] == b"-":
+        offset = -offset
+    return midnight + int(clf_time[12:14]) * 3600 + int(clf_time[15:17]) * 60 + int(clf_time[18:20]) - offset
+
+def parse_requests(lines, stats=None):
+    """
+    Parses lines into (timestamp, endpoint, count) tuples, lines that can't be parsed are
+    skipped and counted in stats["skipped"]
+    """
+    if stats is None:
+        stats = {}
+    stats.setdefault("skipped", 0)
+    days = {}
+    endpoints = {}
+    last_clf_time = None
+    last_clf_timestamp = None
+    for line in lines:
+        try:
+            open_bracket = line.find(b"[")
+            if open_bracket != -1:
+                # Access log, consecutive lines almost always share a second, so the timestamp
+                # is only converted when it changes
+                close_bracket = line.index(b"]", open_bracket)
+                clf_time = line[open_bracket + 1:close_bracket]
+                if clf_time != last_clf_time:
+                    last_clf_timestamp = _clf_timestamp(clf_time, days)
+                    last_clf_time = clf_time
+                request_start = line.index(b'"', close_bracket) + 1
+                request_end = line.index(b'"', request_start)
+                path = line[request_start:request_end].split(b" ")[1]
+                endpoint = endpoints.get(path)
+                if endpoint is None:
+                    if len(endpoints) >= ENDPOINT_CACHE_SIZE:
+                        endpoints.clear()
+                    endpoint = normalise_endpoint(path.decode(errors="replace"))
+                    endpoints[path] = endpoint
+                yield last_clf_timestamp, endpoint, 1
+                continue
+
+            fields = line.strip().split(b",")
+            if len(fields) < 2:
+                raise ValueError("expected at least timestamp,count")
+            timestamp = fields[0].decode()
+            try:
+                timestamp = int(float(timestamp))
+                while timestamp >= MAX_EPOCH_SECONDS:
+                    timestamp //= 1000
+            except ValueError:
+                parsed = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+                if parsed.tzinfo is None:
+                    parsed = parsed.replace(tzinfo=timezone.utc)
+                timestamp = int(parsed.timestamp())
+            endpoint = normalise_endpoint(fields[2].decode(errors="replace")) if len(fields) > 2 else OTHER_ENDPOINT
+            yield timestamp, endpoint, int(float(fields[1]))
+        except (ValueError, IndexError):
+            # Includes CSV headers and blank lines
+            stats["skipped"] += 1
+
+def merge_requests(paths, stats=None):
+    """
+    Parses each input separately, merging their requests in time order
+    """
+    if stats is None:
+        stats = {}
+    requests = [parse_requests(read_lines([path]), stats) for path in paths]
+    if len(requests) == 1:
+        return requests[0]
+    return heapq.merge(*requests, key=lambda request: request[0])
+
+class HeavyHitters:
+    """
+    Approximate counts of the most frequent endpoints in bounded memory (Misra-Gries); any
+    endpoint making up more than 1/(capacity+1) of all requests stays tracked. Up to twice
+    capacity endpoints are counted before evicting in a batch, so the counts are only rebuilt
+    once every capacity new endpoints rather than for every new endpoint
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        self.evicted = False
+
+    def add(self, endpoint, count):
+        """
+        Counts requests for an endpoint, returning whether it is frequent enough to record. Once
+        endpoints have been evicted, only those already tracked are, so that rarely requested
+        endpoints never reach the profile however many distinct endpoints there are
+        """
+        counts = self.counts
+        tracked = endpoint in counts
+        counts[endpoint] = counts[endpoint] + count if tracked else count
+        if not tracked and len(counts) > 2 * self.capacity:
+            # Taking the capacity+1th largest count from every count leaves at most capacity
+            threshold = heapq.nlargest(self.capacity + 1, counts.values())[-1]
+            self.counts = {kept: kept_count - threshold for kept, kept_count in counts.items() if kept_count > threshold}
+            self.evicted = True
+        return tracked or not self.evicted
+
+def bin_windows(requests, interval=MIX_INTERVAL, max_endpoints=MAX_ENDPOINTS, stats=None):
+    """
+    Bins requests into consecutive windows of per second counts and endpoint mixes; only the
+    current window is held in memory. Inputs are expected to be in time order, requests for a
+    window that has already been emitted are dropped and counted in stats["late"], and requests
+    with implausible timestamps are dropped and counted in stats["skipped"]. Mixes record the
+    endpoints that are frequent so far, others are recorded as OTHER_ENDPOINT,
+    collapse_endpoints then keeps only the most frequent overall
+    """
+    if stats is None:
+        stats = {}
+    stats.setdefault("late", 0)
+    stats.setdefault("skipped", 0)
+    stats.setdefault("requests", 0)
+    latest = time.time() + MAX_FUTURE
+    heavy_hitters = HeavyHitters(max_endpoints * CANDIDATES_PER_ENDPOINT)
+    window = None
+    for timestamp, endpoint, count in requests:
+        if not MIN_TIMESTAMP <= timestamp <= latest or (window is not None and timestamp >= window.start + interval + MAX_GAP):
+            stats["skipped"] += 1
+            continue
+        if window is None:
+            window = Window(timestamp - timestamp % interval, [0] * interval, {})
+        if timestamp < window.start:
+            stats["late"] += count
+            continue
+        while timestamp >= window.start + interval:
+            yield window
+            window = Window(window.start + interval, [0] * interval, {})
+
+        if endpoint != OTHER_ENDPOINT and not heavy_hitters.add(endpoint, count):
+            endpoint = OTHER_ENDPOINT
+        window.counts[timestamp - window.start] += count
+        window.mix[endpoint] = window.mix.get(endpoint, 0) + count
+        stats["requests"] += count
+    if window is not None:
+        yield window
+
+def count_endpoints(windows, totals):
+    """
+    Passes windows through, adding the requests for each endpoint to totals
+    """
+    for window in windows:
+        for endpoint, count in window.mix.items():
+            totals[endpoint] = totals.get(endpoint, 0) + count
+        yield window
+
+def collapse_endpoints(windows, endpoints):
+    """
+    Passes windows through, with the requests for any endpoint not in endpoints moved to
+    OTHER_ENDPOINT
+    """
+    for window in windows:
+        mix = {}
+        for endpoint, count in window.mix.items():
+            if endpoint not in endpoints:
+                endpoint = OTHER_ENDPOINT
+            mix[endpoint] = mix.get(endpoint, 0) + count
+        yield Window(window.start, window.counts, mix)
+
+def _varint(value):
+    encoded = bytearray()
+    while value >= 0x80:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return encoded
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+def encode_windows(windows):
+    """
+    Yields the encoded body for each window. Per second counts are stored as zigzag varint
+    deltas from the previous second, and endpoints are given IDs in the order they first appear
+    """
+    endpoint_ids = {}
+    previous = 0
+    for window in windows:
+        body = bytearray(_varint(len(window.counts)))
+        for count in window.counts:
+            body += _varint(_zigzag(count - previous))
+            previous = count
+
+        new_endpoints = [endpoint for endpoint in window.mix if endpoint not in endpoint_ids]
+        body += _varint(len(new_endpoints))
+        for endpoint in new_endpoints:
+            endpoint_ids[endpoint] = len(endpoint_ids)
+            encoded = endpoint.encode()
+            body += _varint(len(encoded))
+            body += encoded
+
+        body += _varint(len(window.mix))
+        for endpoint, count in window.mix.items():
+            body += _varint(endpoint_ids[endpoint])
+            body += _varint(count)
+        yield body
+
+def write_profile(windows, path, interval=MIX_INTERVAL):
+    """
+    Writes windows to a compressed profile, streaming so the whole profile is never in memory.
+    Returns the number of windows written
+    """
+    windows = iter(windows)
+    first = next(windows, None)
+    num_windows = 0
+    compressor = zlib.compressobj(9)
+    with open(path, "wb") as file:
+        file.write(MAGIC)
+        file.write(HEADER.pack(first.start if first is not None else 0, interval))
+        if first is not None:
+            for body in encode_windows(itertools.chain([first], windows)):
+                file.write(compressor.compress(bytes(body)))
+                num_windows += 1
+        file.write(compressor.flush())
+    return num_windows
+
+class _Reader:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.data = b""
+        self.position = 0
+
+    def _fill(self):
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            return False
+        self.data = self.data[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def at_end(self):
+        while self.position >= len(self.data):
+            if not self._fill():
+                return True
+        return False
+
+    def byte(self):
+        if self.at_end():
+            raise ValueError("profile is truncated")
+        value = self.data[self.position]
+        self.position += 1
+        return value
+
+    def varint(self):
+        value = 0
+        shift = 0
+        while True:
+            byte = self.byte()
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return value
+            shift += 7
+
+    def bytes(self, length):
+        while len(self.data) - self.position < length:
+            if not self._fill():
+                raise ValueError("profile is truncated")
+        value = self.data[self.position:self.position + length]
+        self.position += length
+        return value
+
+def _decompressed(file):
+    decompressor = zlib.decompressobj()
+    while True:
+        data = file.read(READ_BUFFER)
+        if not data:
+            break
+        yield decompressor.decompress(data)
+    yield decompressor.flush()
+
+def _read_header(file, path):
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f"{path} is not a load profile")
+    return HEADER.unpack(file.read(HEADER.size))
+
+def read_profile(path):
+    """
+    Returns the window interval of a profile, from its header, and a generator of each of its
+    windows in order
+    """
+    with open(path, "rb") as file:
+        _, interval = _read_header(file, path)
+    return interval, _read_windows(path)
+
+def _read_windows(path):
+    with open(path, "rb") as file:
+        start, interval = _read_header(file, path)
+        reader = _Reader(_decompressed(file))
+        endpoints = []
+        previous = 0
+        window_start = start
+        while not reader.at_end():
+            counts = []
+            for _ in range(reader.varint()):
+                delta = reader.varint()
+                previous += (delta >> 1) ^ -(delta & 1)
+                counts.append(previous)
+            for _ in range(reader.varint()):
+                endpoints.append(reader.bytes(reader.varint()).decode())
+            mix = {}
+            for _ in range(reader.varint()):
+                endpoint = endpoints[reader.varint()]
+                mix[endpoint] = reader.varint()
+            yield Window(window_start, counts, mix)
+            window_start += interval
+
+class Profile:
+    """
+    A profile loaded for replay, holding only the average rate of each step and the endpoint mix
+    of each window
+    """
+    def __init__(self, path, step=REPLAY_STEP):
+        self.step = step
+        self.windows = []
+        self.interval, windows = read_profile(path)
+        for window in windows:
+            rates = [sum(window.counts[i:i + step]) / len(window.counts[i:i + step]) for i in range(0, len(window.counts), step)]
+            self.windows.append((window.start, rates or [0], window.mix))
+        if not self.windows:
+            raise ValueError(f"{path} has no windows")
+        self.start = self.windows[0][0]
+        self.duration = self.interval * len(self.windows)
+
+    def at(self, timestamp):
+        """
+        Returns the (rate, mix, seconds) for a time, the rate of the step containing it, the mix
+        of its window and the seconds until the step ends. The profile is looped and stays
+        aligned to its original clock, so a profile of whole weeks replays each day of the week
+        in place
+        """
+        offset = (timestamp - self.start) % self.duration
+        _, rates, mix = self.windows[int(offset // self.interval)]
+        window_offset = offset % self.interval
+        step = min(int(window_offset // self.step), len(rates) - 1)
+        step_end = min((step + 1) * self.step, self.interval)
+        return rates[step], mix, max(1, math.ceil(step_end - window_offset))
+
+def ingest(args):
+    stats = {}
+    totals = {}
+    windows = bin_windows(merge_requests(args.inputs, stats),
+        interval=args.interval, max_endpoints=args.max_endpoints, stats=stats)
+    # Input may be streamed from stdin, so rather than reading it twice the profile is written
+    # with every candidate endpoint and then rewritten keeping only the most requested
+    partial = args.output + ".partial"
+    write_profile(count_endpoints(windows, totals), partial, interval=args.interval)
+    endpoints = sorted((endpoint for endpoint in totals if endpoint != OTHER_ENDPOINT), key=lambda endpoint: -totals[endpoint])
+    interval, partial_windows = read_profile(partial)
+    num_windows = write_profile(collapse_endpoints(partial_windows, set(endpoints[:args.max_endpoints])),
+        args.output, interval=interval)
+    os.remove(partial)
+    print(f"Wrote {num_windows} windows of {args.interval}s ({stats['requests']} requests) to {args.output}")
+    print(f"Skipped {stats['skipped']} unparseable lines or implausible timestamps, dropped {stats['late']} requests "
+        "earlier than a window already written")
+
+def show(args):
+    _, windows = read_profile(args.profile)
+    for window in windows:
+        time = datetime.fromtimestamp(window.start, timezone.utc).strftime("%Y-%m-%d %H:%M")
+        mix = ", ".join(f"{endpoint}: {count}" for endpoint, count in sorted(window.mix.items(), key=lambda item: -item[1]))
+        print(f"{time} {window.rate():.2f} req/s, peak {max(window.counts, default=0)} req/s; {mix}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest production traffic into load profiles")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = subparsers.add_parser("ingest", help="ingest access logs or request rate exports into a profile")
+    ingest_parser.add_argument("inputs", nargs="+", help="input files, optionally gzipped, or - for stdin")
+    ingest_parser.add_argument("-o", "--output", required=True, help="profile file to write")
+    ingest_parser.add_argument("--interval", type=int, default=MIX_INTERVAL,
+        help="seconds per window, each window records its own endpoint mix")
+    ingest_parser.add_argument("--max-endpoints", type=int, default=MAX_ENDPOINTS,
+        help=f"maximum number of distinct endpoints, the most requested are kept and any others recorded as {OTHER_ENDPOINT}")
+    ingest_parser.set_defaults(func=ingest)
+
+    show_parser = subparsers.add_parser("show", help="print the rate and endpoint mix of each window of a profile")
+    show_parser.add_argument("profile")
+    show_parser.set_defaults(func=show)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -12,13 +12,24 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import json
-import numpy as np
-from tabulate import tabulate
-from matplotlib import pyplot as plt
+
+# Each probe is 30 seconds apart, over 30 minutes
+TIMES = [i * 0.5 for i in range(60)]
+
+def pyplot():
+    """
+    Imports pyplot on first use with a non-interactive backend, so table only analysis never
+    pays the cost of loading matplotlib
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib import pyplot as plt
+    return plt
 
 def plot_replica_comparison(horizontal_replicas, predictive_replicas):
+    plt = pyplot()
     plt.figure(figsize=[6, 6])
-    plt.plot(list(np.arange(0, 30, 0.5)), horizontal_replicas, "r", list(np.arange(0, 30, 0.5)), predictive_replicas, "b")
+    plt.plot(TIMES, horizontal_replicas, "r", TIMES, predictive_replicas, "b")
     plt.legend(["K8s HPA", "CPA Predictive HPA"])
     plt.xlabel("time (minutes)")
     plt.ylabel("number of replicas")
@@ -36,8 +47,9 @@ def plot_avg_latency_comparison(horizontal_latencies, predictive_latencies):
             continue
         predictive_avg_latencies.append(result["requests"].get("GET_/api/v1/namespaces/default/services/predictive-deployment/proxy//").get("avg_response_time"))
     
+    plt = pyplot()
     plt.figure(figsize=[6, 6])
-    plt.plot(list(np.arange(0, 30, 0.5)), horizontal_avg_latencies, "r", list(np.arange(0, 30, 0.5)), predictive_avg_latencies, "b")
+    plt.plot(TIMES, horizontal_avg_latencies, "r", TIMES, predictive_avg_latencies, "b")
     plt.legend(["K8s HPA", "CPA Predictive HPA"])
     plt.xlabel("time (minutes)")
     plt.ylabel("average latency")
@@ -56,8 +68,9 @@ def plot_max_latency_comparison(horizontal_latencies, predictive_latencies):
             continue
         predictive_max_latencies.append(result["requests"].get("GET_/api/v1/namespaces/default/services/predictive-deployment/proxy//").get("max_response_time"))
     
+    plt = pyplot()
     plt.figure(figsize=[6, 6])
-    plt.plot(list(np.arange(0, 30, 0.5)), horizontal_max_latencies, "r", list(np.arange(0, 30, 0.5)), predictive_max_latencies, "b")
+    plt.plot(TIMES, horizontal_max_latencies, "r", TIMES, predictive_max_latencies, "b")
     plt.legend(["K8s HPA", "CPA Predictive HPA"])
     plt.xlabel("time (minutes)")
     plt.ylabel("maximum latency")
@@ -75,14 +88,15 @@ def plot_failed_to_success_request_percentage(horizontal_latencies, predictive_l
             continue
         predictive_fail_percentages.append(result["num_requests_fail"] / result["num_requests"] * 100)
     
+    plt = pyplot()
     plt.figure(figsize=[6, 6])
-    plt.plot(list(np.arange(0, 30, 0.5)), horizontal_fail_percentages, "r", list(np.arange(0, 30, 0.5)), predictive_fail_percentages, "b")
+    plt.plot(TIMES, horizontal_fail_percentages, "r", TIMES, predictive_fail_percentages, "b")
     plt.legend(["K8s HPA", "CPA Predictive HPA"])
     plt.xlabel("time (minutes)")
     plt.ylabel("failed requests (%)")
     plt.savefig("results/fail_percentage_comparison.svg")
 
-def create_table(horizontal_replicas, predictive_replicas, horizontal_latencies, predictive_latencies):
+def build_table(horizontal_replicas, predictive_replicas, horizontal_latencies, predictive_latencies):
 
     horizontal_num_requests = []
     for result in horizontal_latencies:
@@ -129,7 +143,7 @@ def create_table(horizontal_replicas, predictive_replicas, horizontal_latencies,
         predictive_fail_percentages.append(result["num_requests_fail"] / result["num_requests"] * 100)
 
     table = {
-        "time (mins)": list(np.arange(0, 30, 0.5)),
+        "time (mins)": TIMES,
         "hpa num requests": horizontal_num_requests,
         "phpa num requests": predictive_num_requests,
         "hpa replicas": horizontal_replicas,
@@ -141,11 +155,16 @@ def create_table(horizontal_replicas, predictive_replicas, horizontal_latencies,
         "hpa fail requests (%)": horizontal_fail_percentages,
         "phpa fail requests (%)": predictive_fail_percentages
     }
+    return table
+
+def create_table(horizontal_replicas, predictive_replicas, horizontal_latencies, predictive_latencies):
+    from tabulate import tabulate
 
+    table = build_table(horizontal_replicas, predictive_replicas, horizontal_latencies, predictive_latencies)
     with open("results/predictive_vs_horizontal_table.md", "w") as table_file:
         table_file.write(tabulate(table, tablefmt="pipe", headers="keys"))
 
-def main():
+def load_results():
     with open("results/results.json") as json_file:
         results = json.load(json_file)
     horizontal_replicas = results["horizontal"]["replicas"]
@@ -154,6 +173,10 @@ def main():
     predictive_latencies = results["predictive"]["latency"]
     horizontal_latencies = sorted(horizontal_latencies, key=lambda k: k["start_time"])
     predictive_latencies = sorted(predictive_latencies, key=lambda k: k["start_time"])
+    return horizontal_replicas, predictive_replicas, horizontal_latencies, predictive_latencies
+
+def main():
+    horizontal_replicas, predictive_replicas, horizontal_latencies, predictive_latencies = load_results()
     create_table(horizontal_replicas, predictive_replicas, horizontal_latencies, predictive_latencies)
     plot_replica_comparison(horizontal_replicas, predictive_replicas)
     plot_avg_latency_comparison(horizontal_latencies, predictive_latencies)
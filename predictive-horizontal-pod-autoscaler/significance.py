@@ -0,0 +1,366 @@
+# Copyright 2020 Jamie Thompson.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Compares repeated HPA and PHPA runs, producing bootstrap confidence intervals for the
+difference between the two autoscalers
+"""
+import argparse
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from tabulate import tabulate
+
+SHORT_PROBE_INTERVAL = 30 # short experiment samples replicas every 30 seconds
+
+# The p99 is a true request p99 when every run has locust's response time histograms (the short
+# experiment), otherwise only the average latency of each interval is known (the long experiment)
+P99 = 0.99
+P99_LATENCY = "p99 latency"
+P99_INTERVAL_LATENCY = "p99 of interval avg latency"
+
+RESAMPLES = 10000
+CONFIDENCE = 95
+# Comparing a single run per autoscaler can't separate run to run noise from a real difference
+MIN_RUNS = 2
+# Upper bound on the size of a single resampling matrix, keeps each worker's memory use bounded
+# regardless of how long a run is
+MAX_CHUNK_ELEMENTS = 2_000_000
+
+OUTPUT_FILE = "results/predictive_vs_horizontal_significance.md"
+
+class Run:
+    """
+    Per interval samples for a single run of one autoscaler. Latencies are NaN for intervals where
+    no request succeeded; histograms, if known, hold the count of requests for each response time
+    in bins for each interval
+    """
+    def __init__(self, latencies, num_requests, num_requests_fail, replicas, duration, histograms=None, bins=None):
+        self.latencies = np.asarray(latencies, dtype=np.float64)
+        self.num_requests = np.asarray(num_requests, dtype=np.float64)
+        self.num_requests_fail = np.asarray(num_requests_fail, dtype=np.float64)
+        self.replicas = np.asarray(replicas, dtype=np.float64)
+        self.duration = float(duration)
+        self.histograms = histograms
+        self.bins = bins
+
+    def metrics(self):
+        """
+        Metrics for the run as observed, in the order of metric_names
+        """
+        known = ~np.isnan(self.latencies)
+        latency_requests = self.num_requests[known].sum()
+        total_requests = self.num_requests.sum()
+        if self.histograms is not None:
+            p99 = _histogram_p99(self.histograms.sum(axis=0)[None, :], self.bins)[0]
+        else:
+            values = np.sort(self.latencies[known])[::-1]
+            p99 = values[_rank_from_top(len(values)) - 1] if len(values) else np.nan
+        return np.array([
+            (self.latencies[known] * self.num_requests[known]).sum() / latency_requests if latency_requests else np.nan,
+            p99,
+            self.num_requests_fail.sum() / total_requests * 100 if total_requests else np.nan,
+            self.replicas.mean() * self.duration
+        ])
+
+def metric_names(runs):
+    p99 = P99_LATENCY if all(run.histograms is not None for run in runs) else P99_INTERVAL_LATENCY
+    return ["mean latency", p99, "fail requests (%)", "replica seconds"]
+
+def load_short_run(path):
+    """
+    Loads a short experiment results JSON file, returning a (hpa, phpa) pair of runs
+    """
+    with open(path) as json_file:
+        results = json.load(json_file)
+    return (
+        _short_run(path, results["horizontal"], "horizontal-deployment"),
+        _short_run(path, results["predictive"], "predictive-deployment")
+    )
+
+def _short_run(path, result, target):
+    latencies = []
+    num_requests = []
+    num_requests_fail = []
+    response_times = []
+    for stats in sorted(result["latency"], key=lambda k: k["start_time"]):
+        request = stats["requests"].get(f"GET_/api/v1/namespaces/default/services/{target}/proxy//")
+        if request is None:
+            continue
+        latency = request.get("avg_response_time")
+        latencies.append(np.nan if latency is None else latency)
+        num_requests.append(stats["num_requests"])
+        num_requests_fail.append(stats["num_requests_fail"])
+        response_times.append(request.get("response_times"))
+    if not latencies:
+        raise ValueError(f"{path} has no {target} load results")
+
+    # Locust records a histogram of response times for each interval, from which a true request
+    # p99 can be found; JSON turns its keys into strings
+    histograms = None
+    bins = None
+    if all(times is not None for times in response_times):
+        bins = np.array(sorted({float(time) for times in response_times for time in times}))
+        histograms = np.zeros((len(response_times), len(bins)))
+        for i, times in enumerate(response_times):
+            for time, count in times.items():
+                histograms[i, np.searchsorted(bins, float(time))] = count
+    replicas = result["replicas"]
+    return Run(latencies, num_requests, num_requests_fail, replicas, len(replicas) * SHORT_PROBE_INTERVAL, histograms, bins)
+
+def load_long_run(path):
+    """
+    Loads a long experiment results directory, containing hpa/ and phpa/ CSV results, returning
+    a (hpa, phpa) pair of runs
+    """
+    return (
+        _long_run(os.path.join(path, "hpa")),
+        _long_run(os.path.join(path, "phpa"))
+    )
+
+def _optional_float(value):
+    # The load generator writes None for latencies when no request in a run succeeded
+    return np.nan if value == "None" else float(value)
+
+def _long_run(path):
+    latencies = []
+    num_requests = []
+    num_requests_fail = []
+    load_path = os.path.join(path, "load.csv")
+    with open(load_path) as load_file:
+        # First row is dropped, matching long/analyse.py
+        for row in list(csv.reader(load_file))[1:]:
+            num_requests.append(float(row[1]))
+            num_requests_fail.append(float(row[2]))
+            latencies.append(_optional_float(row[3]))
+    if not latencies:
+        raise ValueError(f"{load_path} has no load results")
+    times = []
+    replicas = []
+    replicas_path = os.path.join(path, "replicas.csv")
+    with open(replicas_path) as replicas_file:
+        for row in list(csv.reader(replicas_file))[1:]:
+            times.append(float(row[0]))
+            replicas.append(float(row[1]))
+    if len(times) < 2:
+        raise ValueError(f"{replicas_path} needs at least two replica counts")
+    return Run(latencies, num_requests, num_requests_fail, replicas, times[-1] - times[0])
+
+def _block_length(samples):
+    """
+    Samples are strongly autocorrelated, so they are resampled in blocks, sized by the usual
+    cube root rule
+    """
+    return max(1, round(samples ** (1 / 3)))
+
+def _blocks(values, length):
+    """
+    Splits values into non-overlapping blocks of length, dropping any remainder, returning an
+    array of shape (blocks, length, ...)
+    """
+    num_blocks = len(values) // length
+    return values[:num_blocks * length].reshape(num_blocks, length, *values.shape[1:])
+
+def _block_data(run, resamples):
+    """
+    Everything a worker needs to resample a run, reduced to per block sums so that only small
+    arrays are sent to each worker
+    """
+    latency_length = _block_length(len(run.latencies))
+    known = ~np.isnan(run.latencies)
+    latency_requests = np.where(known, run.num_requests, 0)
+    weighted_latencies = np.where(known, run.latencies, 0) * run.num_requests
+    sums = np.stack([weighted_latencies, latency_requests, run.num_requests, run.num_requests_fail], axis=1)
+    data = {
+        "resamples": resamples,
+        "sums": _blocks(sums, latency_length).sum(axis=1),
+        "duration": run.duration
+    }
+    num_blocks = len(data["sums"])
+
+    if run.histograms is not None:
+        data["histograms"] = _blocks(run.histograms, latency_length).sum(axis=1)
+        data["bins"] = run.bins
+        width = len(run.bins)
+    else:
+        # Interval latencies largest first, with the block each belongs to
+        blocked = _blocks(run.latencies, latency_length)
+        block_ids = np.repeat(np.arange(num_blocks), latency_length)
+        flat = blocked.ravel()
+        order = np.argsort(-flat[~np.isnan(flat)], kind="stable")
+        data["sorted_latencies"] = flat[~np.isnan(flat)][order]
+        data["sorted_blocks"] = block_ids[~np.isnan(flat)][order]
+        data["block_known"] = (~np.isnan(blocked)).sum(axis=1)
+        # Bounded by the fallback in _top_p99, which covers every latency
+        width = len(data["sorted_latencies"])
+
+    replica_length = _block_length(len(run.replicas))
+    data["replica_sums"] = _blocks(run.replicas, replica_length).sum(axis=1)
+    data["replica_samples"] = len(data["replica_sums"]) * replica_length
+
+    data["chunk_size"] = max(1, MAX_CHUNK_ELEMENTS // max(width, num_blocks, len(data["replica_sums"])))
+    return data
+
+def _rank_from_top(total):
+    """
+    Position of the nearest rank 99th percentile, counting from the largest sample
+    """
+    return total - np.ceil(P99 * total).astype(np.int64) + 1
+
+def _histogram_p99(histograms, bins):
+    total = histograms.sum(axis=1)
+    target = np.ceil(P99 * total)
+    position = (histograms.cumsum(axis=1) < target[:, None]).sum(axis=1)
+    return np.where(total > 0, bins[np.minimum(position, len(bins) - 1)], np.nan)
+
+def _top_p99(counts, values, blocks, totals):
+    """
+    Nearest rank 99th percentile of resampled interval latencies, where counts holds how many
+    times each block was drawn. Only the largest few latencies can hold the p99, so the
+    cumulative counts are only taken over those, falling back to every latency for any resample
+    where that isn't enough
+    """
+    ranks = _rank_from_top(totals)
+    top = min(len(values), 4 * int(ranks.max(initial=1)) + 100)
+    cumulative = counts[:, blocks[:top]].cumsum(axis=1)
+    position = (cumulative < ranks[:, None]).sum(axis=1)
+    missed = position == top
+    if missed.any() and top < len(values):
+        cumulative = counts[missed][:, blocks].cumsum(axis=1)
+        position[missed] = (cumulative < ranks[missed, None]).sum(axis=1)
+    return np.where(totals > 0, values[np.minimum(position, len(values) - 1)], np.nan)
+
+def _block_counts(rng, num_blocks, size):
+    """
+    Draws size block bootstrap resamples, returning how many times each block was drawn in each
+    """
+    indices = rng.integers(0, num_blocks, size=(size, num_blocks)) + (np.arange(size) * num_blocks)[:, None]
+    return np.bincount(indices.ravel(), minlength=size * num_blocks).reshape(size, num_blocks).astype(np.float64)
+
+def _resample_run(task):
+    """
+    Draws every within-run block bootstrap resample for a single run, run in a worker process.
+    Returns an array of shape (metrics, resamples)
+    """
+    data, seed = task
+    rng = np.random.default_rng(seed)
+    resamples = data["resamples"]
+    num_blocks = len(data["sums"])
+    num_replica_blocks = len(data["replica_sums"])
+    metrics = np.empty((4, resamples))
+    for start in range(0, resamples, data["chunk_size"]):
+        size = min(data["chunk_size"], resamples - start)
+        counts = _block_counts(rng, num_blocks, size)
+        weighted_latency, latency_requests, num_requests, num_requests_fail = (counts @ data["sums"]).T
+        if "histograms" in data:
+            p99 = _histogram_p99(counts @ data["histograms"], data["bins"])
+        else:
+            p99 = _top_p99(counts, data["sorted_latencies"], data["sorted_blocks"],
+                (counts @ data["block_known"]).astype(np.int64))
+        replica_counts = _block_counts(rng, num_replica_blocks, size)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            metrics[0, start:start + size] = weighted_latency / latency_requests
+            metrics[2, start:start + size] = num_requests_fail / num_requests * 100
+        metrics[1, start:start + size] = p99
+        metrics[3, start:start + size] = replica_counts @ data["replica_sums"] / data["replica_samples"] * data["duration"]
+    return metrics
+
+def bootstrap(hpa_runs, phpa_runs, resamples=RESAMPLES, confidence=CONFIDENCE, workers=None, seed=None):
+    """
+    Two level bootstrap of the PHPA - HPA difference for each metric; runs are resampled with
+    replacement, and each run's intervals are block resampled with replacement. Each run's
+    resampling is a task for a process pool. Returns a list of rows of
+    (metric, hpa mean, phpa mean, difference, CI low, CI high)
+    """
+    if len(hpa_runs) < MIN_RUNS or len(phpa_runs) < MIN_RUNS:
+        raise ValueError(f"at least {MIN_RUNS} runs of each autoscaler are needed, "
+            f"got {len(hpa_runs)} hpa and {len(phpa_runs)} phpa")
+    arms = [hpa_runs, phpa_runs]
+    runs = hpa_runs + phpa_runs
+    seeds = np.random.SeedSequence(seed).spawn(len(runs) + 1)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        resampled = list(executor.map(_resample_run,
+            [(_block_data(run, resamples), run_seed) for run, run_seed in zip(runs, seeds)]))
+
+    rng = np.random.default_rng(seeds[-1])
+    arm_means = []
+    for arm, arm_resampled in zip(arms, [resampled[:len(hpa_runs)], resampled[len(hpa_runs):]]):
+        # Shape (runs, metrics, resamples)
+        run_stats = np.stack(arm_resampled)
+        run_indices = rng.integers(0, len(arm), size=(resamples, len(arm)))
+        # Each draw of a run takes an independent inner resample, so a run drawn more than once
+        # doesn't repeat the same resample
+        inner_indices = rng.integers(0, resamples, size=(resamples, len(arm)))
+        # Shape (resamples, runs, metrics) -> (resamples, metrics)
+        arm_means.append(np.nanmean(run_stats[run_indices, :, inner_indices], axis=1))
+    differences = arm_means[1] - arm_means[0]
+
+    alpha = (100 - confidence) / 2
+    lows = np.nanpercentile(differences, alpha, axis=0)
+    highs = np.nanpercentile(differences, 100 - alpha, axis=0)
+
+    hpa_observed = np.nanmean([run.metrics() for run in hpa_runs], axis=0)
+    phpa_observed = np.nanmean([run.metrics() for run in phpa_runs], axis=0)
+
+    rows = []
+    for i, metric in enumerate(metric_names(runs)):
+        rows.append((metric, hpa_observed[i], phpa_observed[i], phpa_observed[i] - hpa_observed[i], lows[i], highs[i]))
+    return rows
+
+def create_table(rows, confidence=CONFIDENCE, output=OUTPUT_FILE):
+    table = {
+        "metric": [row[0] for row in rows],
+        "hpa mean": [row[1] for row in rows],
+        "phpa mean": [row[2] for row in rows],
+        "difference (phpa - hpa)": [row[3] for row in rows],
+        f"{confidence:g}% CI low": [row[4] for row in rows],
+        f"{confidence:g}% CI high": [row[5] for row in rows],
+        "significant": ["yes" if row[4] > 0 or row[5] < 0 else "no" for row in rows]
+    }
+
+    with open(output, "w") as table_file:
+        table_file.write(tabulate(table, tablefmt="pipe", headers="keys"))
+
+def add_arguments(parser):
+    parser.add_argument("experiment", choices=["short", "long"],
+        help="experiment the runs are from")
+    parser.add_argument("runs", nargs="+",
+        help="results.json files (short) or results directories holding hpa/ and phpa/ (long), one per run")
+    parser.add_argument("--resamples", type=int, default=RESAMPLES)
+    parser.add_argument("--confidence", type=float, default=CONFIDENCE)
+    parser.add_argument("--workers", type=int, default=None,
+        help="number of worker processes, defaults to the number of CPUs")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default=OUTPUT_FILE)
+
+def run(args):
+    load_run = load_short_run if args.experiment == "short" else load_long_run
+    try:
+        pairs = [load_run(path) for path in args.runs]
+        rows = bootstrap([hpa for hpa, _ in pairs], [phpa for _, phpa in pairs],
+            resamples=args.resamples, confidence=args.confidence, workers=args.workers, seed=args.seed)
+    except ValueError as err:
+        raise SystemExit(f"Unable to compare runs: {err}")
+    create_table(rows, confidence=args.confidence, output=args.output)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare repeated HPA and PHPA runs with bootstrap confidence intervals")
+    add_arguments(parser)
+    run(parser.parse_args())
+
+if __name__ == "__main__":
+    main()